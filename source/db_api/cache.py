@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import threading
+
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 60 * 60
+
+class NegativeCache():
+    # queries that returned no match, so they aren't looked up again every run
+    def __init__(self, filename = None, ttl = DEFAULT_NEGATIVE_TTL, clock = time.time):
+        self.filename = filename
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = dict()
+        self.lock = threading.Lock()
+
+    def key(self, kind, query):
+        return kind + ":" + query
+
+    def load(self):
+
+        if (not self.filename) or (not os.path.exists(self.filename)):
+            return
+
+        try:
+            with open(self.filename, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            # unreadable cache only costs extra lookups
+            return
+
+        now = self.clock()
+
+        with self.lock:
+            self.entries = { k: t for k, t in entries.items() if not self.expired(t, now) }
+
+    def save(self):
+
+        if not self.filename:
+            return
+
+        with self.lock:
+            now = self.clock()
+            entries = { k: t for k, t in self.entries.items() if not self.expired(t, now) }
+
+        tmp = self.filename + ".tmp"
+
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+
+        os.replace(tmp, self.filename)
+
+    def expired(self, timestamp, now):
+        return (now - timestamp) > self.ttl
+
+    def contains(self, kind, query):
+
+        if self.ttl <= 0:
+            return False
+
+        with self.lock:
+            timestamp = self.entries.get(self.key(kind, query))
+
+        if timestamp is None:
+            return False
+
+        return not self.expired(timestamp, self.clock())
+
+    def add(self, kind, query):
+
+        if self.ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[self.key(kind, query)] = self.clock()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import time
+
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_TIMEOUT = 30.0
+
+class ClientError(Exception):
+    pass
+
+class CallTimeout(ClientError):
+    pass
+
+class RateLimiter():
+    # token bucket, refills at "rate" tokens per second up to "burst" tokens
+    def __init__(self, rate = DEFAULT_RATE, burst = DEFAULT_BURST, clock = time.monotonic, sleep = time.sleep):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+
+        # no limit
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            self.sleep(wait)
+
+class _Call():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight():
+    # concurrent calls with the same key share one in-flight call
+    def __init__(self):
+        self.calls = dict()
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+def call_with_timeout(fn, args, timeout):
+
+    if not timeout:
+        return fn(*args)
+
+    call = _Call()
+
+    def run():
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+        finally:
+            call.done.set()
+
+    # daemon thread so an abandoned call can't keep the process alive
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    if not call.done.wait(timeout):
+        raise CallTimeout("call timed out after {}s".format(timeout))
+
+    if call.error is not None:
+        raise call.error
+
+    return call.result
+
+class Client():
+    # wraps a backend (IMDb() or a local stub with the same methods) with
+    # rate limiting, retries with jittered exponential backoff, per-call
+    # timeouts and coalescing of identical concurrent lookups, only errors in
+    # retry_on are retried, anything else fails straight away
+    def __init__(self, backend, rate = DEFAULT_RATE, burst = DEFAULT_BURST, retries = DEFAULT_RETRIES,
+                 backoff = DEFAULT_BACKOFF, max_backoff = DEFAULT_MAX_BACKOFF, timeout = DEFAULT_TIMEOUT,
+                 retry_on = (), sleep = time.sleep):
+        self.backend = backend
+        self.retry_on = (CallTimeout,) + tuple(retry_on)
+        self.limiter = RateLimiter(rate, burst, sleep = sleep)
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.flight = SingleFlight()
+
+    def delay(self, attempt):
+        # "full jitter": uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request(self, name, *args):
+        # one rate limited backend request
+        self.limiter.acquire()
+        return getattr(self.backend, name)(*args)
+
+    def call(self, name, fn, *args):
+        # fn is one attempt, it must not share state with earlier attempts
+        # because a timed out attempt keeps running in the background
+
+        attempt = 0
+
+        while True:
+            try:
+                return call_with_timeout(fn, args, self.timeout)
+            except self.retry_on as e:
+                if attempt >= self.retries:
+                    raise ClientError("{} failed after {} attempts: {}".format(name, attempt + 1, e)) from e
+            except Exception as e:
+                raise ClientError("{} failed: {}".format(name, e)) from e
+
+            self.sleep(self.delay(attempt))
+            attempt += 1
+
+    def coalesce(self, key, fn, *args):
+        return self.flight.do(key, fn, *args)
+
+    def search_movie(self, query):
+        return self.call("search_movie", self.request, "search_movie", query)
+
+    def get_movie(self, movie_id, info = None):
+        # fetch and update a fresh item on every attempt
+        def attempt():
+            item = self.request("get_movie", movie_id)
+
+            if info:
+                self.request("update", item, info)
+
+            return item
+
+        return self.call("get_movie", attempt)
@@ -4,9 +4,11 @@ class MovieInfo():
     def __init__(self):
         self.title = ""
         self.year = None
+        self.imdb_id = None
 
 class TvInfo():
     def __init__(self):
         self.title = ""
         self.year = None
+        self.imdb_id = None
         self.episodes = dict()
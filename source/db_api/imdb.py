@@ -1,61 +1,102 @@
 #!/usr/bin/env python3
 
 from .common import TvInfo, MovieInfo
+from .client import Client
+from .cache import NegativeCache
 import imdb
 
-imdb_api = imdb.IMDb()
+# errors worth another attempt, the rest won't go away by retrying
+TRANSIENT_ERRORS = (imdb.IMDbDataAccessError,)
+
+client = Client(imdb.IMDb(), retry_on = TRANSIENT_ERRORS)
+negative_cache = NegativeCache()
 past_movie_results = dict()
 past_tv_results = dict()
 
+def configure(backend = None, **kwargs):
+    # replace the client, e.g. to change limits or use a local stub backend
+    global client
+
+    if backend is None:
+        backend = client.backend
+
+    kwargs.setdefault("retry_on", TRANSIENT_ERRORS)
+    client = Client(backend, **kwargs)
+
 def search_tv(query):
-    global past_tv_results
     # check if already have results
     if query in past_tv_results:
         return past_tv_results[query]
-    
-    res = imdb_api.search_movie(query)
-    
+
+    # known to have no match
+    if negative_cache.contains("tv", query):
+        return None
+
+    return client.coalesce(("tv", query), _search_tv, query)
+
+def _search_tv(query):
+    global past_tv_results
+    # another caller may have finished the same lookup
+    if query in past_tv_results:
+        return past_tv_results[query]
+
+    res = client.search_movie(query)
+
     if not res:
-        return None, None
+        negative_cache.add("tv", query)
+        return None
+
+    series = client.get_movie(res[0].movieID, "episodes")
 
-    series = imdb_api.get_movie(res[0].movieID)
-    imdb_api.update(series, "episodes")
-    
     info = TvInfo()
     info.title = series["title"]
     info.year = series["year"]
-    
+    info.imdb_id = "tt" + res[0].movieID
+
     for season in series["episodes"]:
 
         info.episodes[season] = dict()
 
         for episode in series["episodes"][season]:
-        
+
             info.episodes[season][episode] = dict()
             info.episodes[season][episode]["title"] = series["episodes"][season][episode]["title"]
-    
+
     # save to reuse
     past_tv_results[query] = info
-    
+
     return info
 
 def search_movie(query):
-    global past_movie_results
     # check if already have results
     if query in past_movie_results:
         return past_movie_results[query]
-    
-    res = imdb_api.search_movie(query)
-    
+
+    # known to have no match
+    if negative_cache.contains("movie", query):
+        return None
+
+    return client.coalesce(("movie", query), _search_movie, query)
+
+def _search_movie(query):
+    global past_movie_results
+    # another caller may have finished the same lookup
+    if query in past_movie_results:
+        return past_movie_results[query]
+
+    res = client.search_movie(query)
+
     if not res:
+        negative_cache.add("movie", query)
         return None
 
-    movie = imdb_api.get_movie(res[0].movieID)
-    
+    movie = client.get_movie(res[0].movieID)
+
     info = MovieInfo()
     info.title = movie["title"]
     info.year = movie["year"]
+    info.imdb_id = "tt" + res[0].movieID
+
+    past_movie_results[query] = info
 
-    past_movie_results[query] = info 
-    
     return info
@@ -7,12 +7,46 @@ import os.path
 import hashlib
 from utils import file
 from utils.file import FileType
+from utils.checkpoint import Checkpoint, run_id
+from utils.dedup import DedupIndex
+from utils import preflight
+from utils.template import Template, clean_component, MAX_COMPONENT_BYTES
 from utils.language import LANGUAGE_MAP
 from db_api import imdb
+from db_api import client
+from db_api.cache import NegativeCache, DEFAULT_NEGATIVE_TTL
 import colorama
 
 HISTORY_FILENAME = "history"
+CHECKPOINT_FILENAME = "checkpoint"
+NEGATIVE_CACHE_FILENAME = "negative_cache.json"
+DEDUP_INDEX_FILENAME = "dedup_index.json"
+DUPLICATE_MODES = [ "skip", "link", "report" ]
 past_show_info = dict()
+failures = []
+
+# incoming file -> file with the same content, and what to do about it
+duplicates = dict()
+duplicate_mode = None
+dedup_index = None
+
+# source -> destination of files already transferred, including by the
+# run being resumed, skipped files aren't in it
+transferred = dict()
+
+# folders that hold the captions of the video one level up
+SUBTITLE_DIRS = [ "subs", "subtitles", "sub", "subtitle" ]
+
+# trailing filename tags of a caption that aren't part of the video's name
+CAPTION_TAGS = [ "forced", "sdh", "cc" ]
+
+SOURCE_TAGS = [ (["bluray", "bdrip", "brrip", "bdremux"], "BluRay"),
+                (["webdl"], "WEB-DL"),
+                (["webrip"], "WEBRip"),
+                (["web"], "WEB"),
+                (["hdtv"], "HDTV"),
+                (["dvdrip"], "DVDRip"),
+                (["dvd"], "DVD") ]
 
 NON_TITLE_WORDS = [ "bluray", "brrip", "webrip", "aac", "aac2", "h264", "480i", "576i", "480p", "576p", "720p", "1080i", "1080p", "x264", "x265" ]
 
@@ -27,6 +61,13 @@ class Format(Enum):
     EPISODE_TITLE = [ "%t", "episode title" ]
     SEASON        = [ "%s", "season number" ]
     EPISODE       = [ "%e", "episode number" ]
+    LAST_EPISODE  = [ "%E", "last episode number of a multi-episode file" ]
+    RESOLUTION    = [ "%r", "video resolution from the filename" ]
+    SOURCE        = [ "%S", "source tag from the filename (BluRay, WEB-DL, ...)" ]
+    IMDB_ID       = [ "%i", "IMDb id" ]
+
+# default zero padding of number tokens
+FORMAT_WIDTHS = { "s": 2, "e": 2, "E": 2 }
 
 class MediaType(Enum):
     UNKNOWN = 0
@@ -40,6 +81,12 @@ class MediaFile():
         self.filename = None
         self.season = None
         self.episode = None
+        self.last_episode = None
+        self.resolution = None
+        self.source = None
+        self.video = None
+        self.new_filename = None
+        self.destination = None
 
     def __str__(self):
         return self.filename
@@ -49,6 +96,22 @@ def print_error(s):
     print(colorama.Fore.RED + str(s))
     print(colorama.Style.RESET_ALL)
 
+def fail(filename, reason):
+    print_error(reason)
+    failures.append((filename, reason))
+    return False
+
+def print_failures():
+
+    if len(failures) == 0:
+        print("no failures")
+        return
+
+    print_error("{} failure(s):".format(len(failures)))
+
+    for filename, reason in failures:
+        print("\"{}\": {}".format(filename, reason))
+
 def action_to_string(action):
 
     action = Action(action)
@@ -62,41 +125,59 @@ def action_to_string(action):
     else:
         return "invalid"
 
-def format_movie(movie, format, old_filename, language = None):
+def format_key(f):
+    # "%T" -> "T"
+    return f.value[0][1:]
+
+def compile_format(format):
+    return Template(format, [format_key(e) for e in Format], FORMAT_WIDTHS)
+
+def format_movie(movie, format, media, language = None):
 
-    extension = file.extension(old_filename)
+    extension = file.extension(media.filename)
 
     if language:
         extension = "." + language + extension
 
-    new = format
-    
-    new = new.replace(Format.TITLE.value[0], movie.title)
-    new = new.replace(Format.YEAR.value[0], str(movie.year))
-    
-    return new + extension
+    values = dict()
+    values[format_key(Format.TITLE)] = movie.title
+    values[format_key(Format.YEAR)] = movie.year
+    values[format_key(Format.IMDB_ID)] = movie.imdb_id
+    values[format_key(Format.RESOLUTION)] = media.resolution
+    values[format_key(Format.SOURCE)] = media.source
 
-def format_tv(show, format, season, episode, old_filename, language = None):
+    return format.render(values, extension)
 
-    episode_info = show.episodes[season][episode]
+def format_tv(show, format, season, episode, media, language = None):
 
-    extension = file.extension(old_filename)
+    extension = file.extension(media.filename)
 
     if language:
         extension = "." + language + extension
 
-    new = format
+    last_episode = media.last_episode if media.last_episode and (media.last_episode > episode) else None
+
+    # every episode in the file
+    titles = [show.episodes[season][e]["title"] for e in range(episode, (last_episode or episode) + 1) if e in show.episodes[season]]
 
-    new = new.replace(Format.TITLE.value[0], show.title)
-    new = new.replace(Format.YEAR.value[0], str(show.year))
-    new = new.replace(Format.EPISODE_TITLE.value[0], episode_info["title"])
-    new = new.replace(Format.SEASON.value[0], "{:02d}".format(season))
-    new = new.replace(Format.EPISODE.value[0], "{:02d}".format(episode))
+    values = dict()
+    values[format_key(Format.TITLE)] = show.title
+    values[format_key(Format.YEAR)] = show.year
+    values[format_key(Format.EPISODE_TITLE)] = " & ".join(titles)
+    values[format_key(Format.SEASON)] = season
+    values[format_key(Format.EPISODE)] = episode
+    values[format_key(Format.LAST_EPISODE)] = last_episode
+    values[format_key(Format.IMDB_ID)] = show.imdb_id
+    values[format_key(Format.RESOLUTION)] = media.resolution
+    values[format_key(Format.SOURCE)] = media.source
 
-    return new + extension
+    return format.render(values, extension)
     
+def strip_extension(new_filename, old_filename):
+    return new_filename[:len(new_filename) - len(file.extension(old_filename))]
+
 def get_season_episode(s):
-    matches = re.findall("(?i)S(\d+)(?:E(\d+))?", s)
+    matches = re.findall(r"(?i)S(\d+)(?:E(\d+))?", s)
 
     # no results
     if len(matches) == 0:
@@ -111,6 +192,55 @@ def get_season_episode(s):
 
     return int(matches[-1][0]), None
 
+def get_last_episode(s):
+    # "S01E01E02", "S01E01-E02" and "S01E01-02", a bare number is at most
+    # 3 digits so a year ("S01E01-2019") isn't taken for an episode
+    matches = re.findall(r"(?i)S\d+E\d+((?:-?E\d+)+|-\d{1,3}(?![0-9a-z]))", s)
+
+    if len(matches) == 0:
+        return None
+
+    return int(re.findall(r"\d+", matches[-1])[-1])
+
+def get_resolution(s):
+    matches = re.findall(r"(?i)(?<![0-9a-z])(\d{3,4}[pi]|4k)(?![0-9a-z])", s)
+
+    if len(matches) == 0:
+        return None
+
+    return matches[-1].lower()
+
+def get_source(s):
+    words = re.split('[^a-zA-Z0-9]', s)
+    words = [word.lower() for word in words]
+
+    # remove extension
+    words = words[:-1]
+
+    # only look after the title, it may hold a tag word ("Charlotte's Web"),
+    # which ends like in guess_title or at a year
+    start = len(words)
+
+    for i, word in enumerate(words):
+        if is_title_end(word) or ((i > 0) and re.match(r"^(19|20)\d\d$", word)):
+            start = i
+            break
+
+    words = words[start:]
+    words.reverse()
+
+    for i, word in enumerate(words):
+        # tags split in two, "web-dl"
+        candidates = [word]
+        if i > 0:
+            candidates.insert(0, word + words[i - 1])
+
+        for candidate in candidates:
+            for tag in SOURCE_TAGS:
+                if candidate in tag[0]:
+                    return tag[1]
+    return None
+
 def get_language(filename):
     words = re.split('[^a-zA-Z0-9]', filename)
     words = [word.lower() for word in words]
@@ -132,6 +262,8 @@ def identify_media(filename, root_dir = None):
 
     season, episode = get_season_episode(filename)
     rv.file_type = file.type(filename)
+    rv.resolution = get_resolution(filename)
+    rv.source = get_source(filename)
 
     if (rv.file_type == FileType.VIDEO) or (rv.file_type == FileType.CAPTION):
         # tv show file
@@ -139,6 +271,7 @@ def identify_media(filename, root_dir = None):
             rv.media_type = MediaType.TV
             rv.season = season
             rv.episode = episode
+            rv.last_episode = get_last_episode(filename)
 
         # movie file
         else:
@@ -146,6 +279,87 @@ def identify_media(filename, root_dir = None):
 
     return rv
 
+def media_stem(media):
+
+    stem = os.path.splitext(os.path.basename(media.location))[0].lower()
+
+    if media.file_type != FileType.CAPTION:
+        return stem
+
+    # remove language and other caption tags, "name.en.forced" -> "name"
+    parts = stem.split(".")
+
+    while len(parts) > 1:
+        tag = parts[-1]
+
+        if (tag in CAPTION_TAGS) or any(tag in lang[0] for lang in LANGUAGE_MAP):
+            parts.pop()
+        else:
+            break
+
+    return ".".join(parts)
+
+def caption_dirs(caption):
+
+    directory = os.path.dirname(caption.location)
+    dirs = [directory]
+
+    # "Video/Subs/name.srt" and "Video/Subs/name/2_English.srt"
+    for _ in range(2):
+        parent = os.path.dirname(directory)
+
+        if os.path.basename(directory).lower() in SUBTITLE_DIRS:
+            dirs.append(parent)
+            break
+
+        directory = parent
+
+    return dirs
+
+def associate_captions(media):
+
+    by_stem = dict()
+    by_episode = dict()
+    movies_by_dir = dict()
+
+    for m in media:
+        if m.file_type != FileType.VIDEO:
+            continue
+
+        directory = os.path.dirname(m.location)
+
+        by_stem.setdefault((directory, media_stem(m)), []).append(m)
+
+        if m.media_type == MediaType.TV:
+            by_episode.setdefault((directory, m.season, m.episode), []).append(m)
+        elif m.media_type == MediaType.MOVIE:
+            movies_by_dir.setdefault(directory, []).append(m)
+
+    for m in media:
+        if m.file_type != FileType.CAPTION:
+            continue
+
+        for i, directory in enumerate(caption_dirs(m)):
+
+            # same name, then same episode, then the only movie in the folder
+            # holding a Subs/ directory
+            candidates = by_stem.get((directory, media_stem(m)), [])
+
+            if (len(candidates) != 1) and (m.media_type == MediaType.TV) and (m.episode is not None):
+                candidates = by_episode.get((directory, m.season, m.episode), [])
+
+                # next to the video the title has to agree, another show may share the folder
+                if i == 0:
+                    candidates = [v for v in candidates if guess_title(v) == guess_title(m)]
+
+            # next to the video another movie may share the folder
+            if (len(candidates) != 1) and (m.media_type == MediaType.MOVIE) and (i > 0):
+                candidates = movies_by_dir.get(directory, [])
+
+            if len(candidates) == 1:
+                m.video = candidates[0]
+                break
+
 def update_history(old, new, action):
 
     s = "{},{},\"{}\",\"{}\"".format(action_to_string(action), file.checksum(old), old, new)
@@ -154,6 +368,70 @@ def update_history(old, new, action):
     history_file.write(s + "\n")
     history_file.close()
 
+def find_duplicates(media, library_dirs):
+
+    index = DedupIndex(DEDUP_INDEX_FILENAME)
+    index.load()
+
+    for directory in library_dirs:
+        for f in file.listdir(directory, recursive = True):
+            if file.type(f) != FileType.UNKNOWN:
+                index.add_library(f)
+
+    # files moved by a resumed run are found where they went, and are
+    # preferred as the original of their group
+    for m in sorted(media, key=lambda m: m.location not in transferred):
+        path = transferred.get(m.location, m.location)
+
+        # nothing was written in test mode
+        if not os.path.exists(path):
+            path = m.location
+
+        index.add_incoming(path)
+
+    # saved at the end of the run, once transferred files are re-keyed
+    return index.duplicates(), index
+
+def index_transfer(old, new, moved):
+    if dedup_index:
+        dedup_index.add_transfer(old, new, moved)
+
+def apply_duplicate(old, new, original, action):
+
+    print("duplicate of \"{}\"".format(original))
+
+    if duplicate_mode == "skip":
+        print("skip")
+        return True
+
+    # duplicate of a file moved earlier this run
+    target = transferred.get(original, original)
+
+    if os.path.abspath(target) == os.path.abspath(new):
+        transferred[old] = os.path.abspath(new)
+        return True
+
+    if action != Action.TEST:
+
+        if not os.path.exists(target):
+            return fail(old, "duplicate target doesn't exist \"{}\"".format(target))
+
+        try:
+            file.link(target, new)
+
+            if action == Action.MOVE:
+                os.remove(old)
+
+        except OSError as e:
+            return fail(old, "link failed: {}".format(e))
+
+        index_transfer(old, new, action == Action.MOVE)
+
+    transferred[old] = os.path.abspath(new)
+    update_history(old, new, action)
+
+    return True
+
 def apply_action(old, new, action = Action.TEST, interactive = False, print_width = 0):
 
     print("[{}] \"{:<{width}}\" >> \"{}\"".format(action_to_string(action), old, new, width = print_width))
@@ -170,7 +448,7 @@ def apply_action(old, new, action = Action.TEST, interactive = False, print_widt
                 break
             elif (s == "n") or (s == "no"):
                 print("no")
-                return False
+                return None
             if (s == "s") or (s == "skip"):
                 print("skip")
                 return True
@@ -178,24 +456,36 @@ def apply_action(old, new, action = Action.TEST, interactive = False, print_widt
                 print("invalid option")
                 continue
 
+    original = duplicates.get(old)
+
+    if original and (duplicate_mode != "report"):
+        return apply_duplicate(old, new, original, action)
+    elif original:
+        print("duplicate of \"{}\"".format(original))
+
     if action != Action.TEST:
 
         # check if file exists
         if not os.path.exists(old):
-            print_error("file doesn't exist \"{}\"".format(old))
-            return False
+            return fail(old, "file doesn't exist \"{}\"".format(old))
 
         try:
             if action == Action.MOVE:
-                file.move(old, new, make_dirs=True)
+                file.move(old, new)
             elif action == Action.COPY:
-                file.copy(old, new, make_dirs=True)
+                file.copy(old, new)
             else:
                 return False
 
         except FileNotFoundError:
-            print_error("file doesn't exist")
-            return False
+            return fail(old, "file doesn't exist")
+        except OSError as e:
+            return fail(old, "{} failed: {}".format(action_to_string(action), e))
+
+        index_transfer(old, new, action == Action.MOVE)
+
+    # also in test mode so captions are previewed with their video
+    transferred[old] = os.path.abspath(new)
 
     # update history on success
     update_history(old, new, action)
@@ -216,6 +506,13 @@ def get_action(arg):
     print_error("invalid action \"{}\"".format(arg))
     return None
 
+def is_title_end(word):
+
+    # assume title stops when we reach a non-title word or "SxxExx"
+    season, episode = get_season_episode(word)
+
+    return bool(season) or (word in NON_TITLE_WORDS)
+
 def guess_title(media):
 
     filename = media.filename #file.basename
@@ -231,17 +528,56 @@ def guess_title(media):
     
     for word in words:
     
-        # assume title stops when we reach a non-title word or "SxxExx"
-        season, episode = get_season_episode(word)
-
-        if season or (word in NON_TITLE_WORDS):
+        if is_title_end(word):
             break
         else:
             title += word + " "
     
     return title.strip()
 
-def process_movie(mov, action, format, query = None, interactive = False, language = None):
+def caption_language(media, language = None):
+    # returns (language, skip)
+
+    det_language = get_language(media.filename)
+
+    # couldn't identify language
+    if not det_language:
+        print_error("couldn't identify subtitle language")
+        return None, True
+
+    # skip other languages
+    if (language is not None) and (language.lower() != det_language.lower()):
+        return det_language, True
+
+    return det_language, False
+
+def process_caption(cap, language = None):
+
+    print("caption file \"{}\"".format(cap.filename))
+    print("video \"{}\"".format(cap.video.filename))
+
+    det_language, skip = caption_language(cap, language)
+
+    if skip:
+        return True
+
+    if not cap.video.destination:
+        return fail(cap.location, "video \"{}\" was not resolved".format(cap.video.filename))
+
+    # inherit the video's name, only adding the language
+    suffix = "." + det_language + file.extension(cap.filename)
+
+    # the video's name was only limited to fit its own extension
+    head, tail = os.path.split(cap.video.destination)
+    tail = clean_component(tail, MAX_COMPONENT_BYTES - len(suffix.encode("utf-8")))
+
+    cap.destination = os.path.join(head, tail)
+    cap.new_filename = cap.destination + suffix
+
+    print()
+    return True
+
+def process_movie(mov, format, query = None, language = None):
 
     if not query:
         search = guess_title(mov)
@@ -254,34 +590,26 @@ def process_movie(mov, action, format, query = None, interactive = False, langua
     # get subtitle language
     det_language = None
     if mov.file_type == FileType.CAPTION:
-        det_language = get_language(mov.filename)
+        det_language, skip = caption_language(mov, language)
 
-        # couldn't identify language
-        if not det_language:
-            #if not language:
-            print_error("couldn't identify subtitle language")
+        if skip:
             return True
-        # identified a language
-        elif language is not None:
-            if language.lower() != det_language.lower():
-                # skip other languages
-                return True
 
-    info = imdb.search_movie(search)
+    try:
+        info = imdb.search_movie(search)
+    except client.ClientError as e:
+        return fail(mov.location, str(e))
 
     if not info:
-        print_error("not matches found")
-        return False
+        return fail(mov.location, "not matches found for \"{}\"".format(search))
     
-    new_filename = format_movie(info, format, mov.filename, det_language)
-    
-    if not apply_action(mov.location, new_filename, action, interactive=interactive):
-        return False
+    mov.new_filename = format_movie(info, format, mov, det_language)
+    mov.destination = strip_extension(mov.new_filename, mov.filename)
 
     print()
     return True
 
-def process_tv(tv, action, format, query = None, interactive = False, language = None):
+def process_tv(tv, format, query = None, language = None):
 
     if not query:
         search = guess_title(tv)
@@ -291,11 +619,13 @@ def process_tv(tv, action, format, query = None, interactive = False, language =
     print("TV file \"{}\"".format(tv.filename))
     print("search \"{}\"".format(search))
 
-    info = imdb.search_tv(search)
+    try:
+        info = imdb.search_tv(search)
+    except client.ClientError as e:
+        return fail(tv.location, str(e))
 
     if not info:
-        print_error("not matches found")
-        return False
+        return fail(tv.location, "not matches found for \"{}\"".format(search))
     
     # get season and episode from filename
     season, episode = get_season_episode(tv.filename)
@@ -303,40 +633,121 @@ def process_tv(tv, action, format, query = None, interactive = False, language =
     # get subtitle language
     det_language = None
     if tv.file_type == FileType.CAPTION:
-        det_language = get_language(tv.filename)
+        det_language, skip = caption_language(tv, language)
 
-        # couldn't idenfify language
-        if not det_language:
-            print_error("couldn't identify subtitle language")
+        if skip:
             return True
-        # identified a language
-        elif language is not None:
-            if language.lower() != det_language.lower():
-                # skip other languages
-                return True
 
     # check if have info for this episode
     if season not in info.episodes:
-        print_error("season {:>02} not found".format(season))
-        return False
+        return fail(tv.location, "season {:>02} not found".format(season))
     
     if episode not in info.episodes[season]:
-        print_error("S{:>02}E{:>02} not found".format(season, episode))
-        return False
+        return fail(tv.location, "S{:>02}E{:>02} not found".format(season, episode))
     
-    new_filename = format_tv(info, format, season, episode, tv.filename, det_language)
-    
-    if not apply_action(tv.location, new_filename, action, interactive=interactive):
-        return False
+    tv.new_filename = format_tv(info, format, season, episode, tv, det_language)
+    tv.destination = strip_extension(tv.new_filename, tv.filename)
 
     print()
     return True
     
+def check_plan(planned, action):
+    # returns the files that can go ahead, or None if the run can't
+
+    # sources that can't be read fail here instead of stopping the run
+    if action != Action.TEST:
+        readable = []
+
+        for m in planned:
+            try:
+                os.stat(m.location)
+            except FileNotFoundError:
+                fail(m.location, "file doesn't exist \"{}\"".format(m.location))
+                continue
+            except OSError as e:
+                fail(m.location, str(e))
+                continue
+
+            readable.append(m)
+
+        planned = readable
+
+    pairs = []
+    needs = []
+
+    # where the original of a duplicate is or will be
+    planned_destinations = dict((m.location, m.new_filename) for m in planned)
+
+    for m in planned:
+        original = duplicates.get(m.location)
+
+        # nothing will be written
+        if original and (duplicate_mode == "skip"):
+            continue
+
+        if original and (duplicate_mode == "link"):
+            target = transferred.get(original) or planned_destinations.get(original) or original
+
+            # the same content is or will be at the destination, e.g. the same
+            # release in several drop folders, nothing will be written
+            if preflight.normalize(target) == preflight.normalize(m.new_filename):
+                continue
+
+            # hard links can't cross devices, transfer it like any other file
+            if preflight.device(target) != preflight.device(os.path.dirname(os.path.abspath(m.new_filename))):
+                print("can't link \"{}\" to \"{}\" on another device, {} instead".format(m.new_filename, target, action_to_string(action)))
+                del duplicates[m.location]
+                original = None
+
+        pairs.append((m.location, m.new_filename))
+
+        # links and renames on the same device don't need space
+        if original and (duplicate_mode == "link"):
+            continue
+
+        if action == Action.COPY:
+            needs.append((m.new_filename, os.path.getsize(m.location)))
+        elif action == Action.MOVE:
+            if preflight.device(m.location) != preflight.device(os.path.dirname(os.path.abspath(m.new_filename))):
+                needs.append((m.new_filename, os.path.getsize(m.location)))
+
+    collisions = preflight.find_collisions(pairs)
+
+    for src, reason in collisions:
+        fail(src, reason)
+
+    colliding = set(src for src, reason in collisions)
+    planned = [m for m in planned if m.location not in colliding]
+
+    if action == Action.TEST:
+        return planned
+
+    shortfall = preflight.space_shortfall(needs)
+
+    for dest, needed, free in shortfall:
+        print_error("not enough space for \"{}\", need {} bytes, {} free".format(dest, needed, free))
+
+    if len(shortfall) > 0:
+        return None
+
+    try:
+        preflight.make_dirs([m.new_filename for m in planned])
+    except OSError as e:
+        print_error("couldn't create directories: {}".format(e))
+        return None
+
+    return planned
+
 def format_help():
 
     s = ""
     for spec in [e.value for e in Format]:
         s += "\"%{}\" : {}\n".format(spec[0], spec[1])
+
+    # escaped for argparse
+    s += "\"%%2e\" : zero pad a number to 2 digits\n"
+    s += "\"{...}\" : left out if a token in it is empty, e.g. \"{ [%%r]}\"\n"
+    s += "\"%%%%\" : literal \"%%\"\n"
     
     return s
 
@@ -345,6 +756,7 @@ def print_list(l):
         print(str(item))
 
 def main():
+    global duplicates, duplicate_mode, dedup_index
     
     parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
     
@@ -360,6 +772,13 @@ def main():
     parser.add_argument("--interactive", "-int", required = False, action="store_true", help="interactive mode")
     parser.add_argument("--root", required = False, type=str, action="store", help="directory under which all input files are located")
     parser.add_argument("--language", "-lang", required = False, type=str, action="store", help="only use subtitles with this language, fallback to when language is not detected")
+    parser.add_argument("--rate", required = False, type=float, action="store", default=client.DEFAULT_RATE, help="maximum lookups per second, 0 for no limit")
+    parser.add_argument("--retries", required = False, type=int, action="store", default=client.DEFAULT_RETRIES, help="retries per failed lookup")
+    parser.add_argument("--resume", required = False, action="store_true", help="skip files finished by the previous run with the same arguments")
+    parser.add_argument("--negative-ttl", required = False, type=float, action="store", default=DEFAULT_NEGATIVE_TTL / 3600, help="hours to remember searches with no match, 0 to disable")
+    parser.add_argument("--library", required = False, type=str, action="append", default=[], help="library directory to check for duplicates, can be given more than once")
+    parser.add_argument("--duplicates", required = False, type=str, action="store", choices=DUPLICATE_MODES, help="skip, hard link or only report files whose content is already in the library or batch")
+    parser.add_argument("--timeout", required = False, type=float, action="store", default=client.DEFAULT_TIMEOUT, help="seconds before a lookup is abandoned, 0 for no timeout")
 
     args, args_unknown = parser.parse_known_args()
 
@@ -372,10 +791,23 @@ def main():
     interactive = args.interactive
     root_dir = args.root
     language = args.language
+    resume = args.resume
+
+    imdb.configure(rate = args.rate, retries = args.retries, timeout = args.timeout)
+    imdb.negative_cache = NegativeCache(NEGATIVE_CACHE_FILENAME, args.negative_ttl * 3600)
+    imdb.negative_cache.load()
 
     # check for valid action
     if not action:
         return False
+
+    # parse formats once for all files
+    try:
+        movie_template = compile_format(movie_format)
+        tv_template = compile_format(tv_format)
+    except ValueError as e:
+        print_error(e)
+        return False
     
     if not args.list:
         # find episode and caption files
@@ -402,9 +834,13 @@ def main():
     for f in files:
         media.append(identify_media(f, root_dir))
     
+    # captions next to their video are named after it instead of searched for
+    associate_captions(media)
+
     # filter by type
-    movie_files = list(filter(lambda m: (m.media_type == MediaType.MOVIE), media))
-    tv_files = list(filter(lambda m: (m.media_type == MediaType.TV), media))
+    movie_files = list(filter(lambda m: (m.media_type == MediaType.MOVIE) and (not m.video), media))
+    tv_files = list(filter(lambda m: (m.media_type == MediaType.TV) and (not m.video), media))
+    caption_files = list(filter(lambda m: m.video, media))
     
     print("movie_files:")
     print_list(movie_files)
@@ -414,15 +850,103 @@ def main():
     print_list(tv_files)
     print()
 
-    for m in movie_files:
-        if not process_movie(m, action, movie_format, query, interactive, language):
-            return False
+    print("caption_files:")
+    print_list(caption_files)
+    print()
 
-    for m in tv_files:
-        if not process_tv(m, action, tv_format, query, interactive, language):
-            return False
+    checkpoint = Checkpoint(CHECKPOINT_FILENAME, run_id(input, list_filename, root_dir, movie_format, tv_format,
+                                                        action_to_string(action), query, language))
+    checkpoint.start(resume)
 
-    return True
+    # files finished by the run being resumed
+    for m in movie_files + tv_files + caption_files:
+        if checkpoint.is_done(m.location):
+            m.new_filename = checkpoint.destination(m.location)
+
+            if m.new_filename:
+                m.destination = strip_extension(m.new_filename, m.filename)
+
+                # duplicates of it link to where it went
+                transferred[m.location] = os.path.abspath(m.new_filename)
+
+    # find duplicates before any bytes move
+    if args.duplicates:
+        duplicate_mode = args.duplicates
+        duplicates, dedup_index = find_duplicates(movie_files + tv_files + caption_files, args.library)
+
+        print("duplicates:")
+        print_list(["{} == {}".format(d, o) for d, o in duplicates.items()])
+        print()
+
+    planned = []
+    stopped = False
+
+    try:
+        # name every file before anything is transferred
+        for m, format in [(m, movie_template) for m in movie_files] + \
+                         [(m, tv_template) for m in tv_files] + \
+                         [(m, None) for m in caption_files]:
+
+            if checkpoint.is_done(m.location):
+                print("already done \"{}\"".format(m.filename))
+                continue
+
+            if m.video:
+                rv = process_caption(m, language)
+            elif m.media_type == MediaType.MOVIE:
+                rv = process_movie(m, format, query, language)
+            else:
+                rv = process_tv(m, format, query, language)
+
+            if not rv:
+                continue
+
+            if m.new_filename:
+                planned.append(m)
+            else:
+                # skipped caption
+                checkpoint.mark_done(m.location)
+
+        # collisions, free space and directories
+        planned = check_plan(planned, action)
+
+        # keep checkpoint for --resume
+        if planned is None:
+            stopped = True
+            planned = []
+
+        for m in planned:
+
+            # captions follow their video, a failed video is already reported
+            if m.video and (m.video.location not in transferred):
+                print("skip \"{}\", video \"{}\" was not transferred".format(m.filename, m.video.filename))
+                continue
+
+            rv = apply_action(m.location, m.new_filename, action, interactive=interactive)
+
+            # stopped by user, keep checkpoint for --resume
+            if rv is None:
+                stopped = True
+                break
+
+            # destination only if something was written there
+            if rv:
+                checkpoint.mark_done(m.location, m.new_filename if m.location in transferred else None)
+    finally:
+        imdb.negative_cache.save()
+
+        if dedup_index:
+            dedup_index.save()
+
+        checkpoint.close()
+
+    print_failures()
+
+    # nothing left to resume
+    if (not stopped) and (len(failures) == 0):
+        checkpoint.remove()
+
+    return (not stopped) and (len(failures) == 0)
     
 if __name__ == "__main__":
     main()
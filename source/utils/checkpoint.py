@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+
+class Checkpoint():
+    # records files finished by a run so an interrupted run can be resumed,
+    # first line is the run id, every following line is a finished file
+    # optionally followed by a tab and its destination
+    def __init__(self, filename, run_id):
+        self.filename = filename
+        self.run_id = run_id
+        self.done = dict()
+        self.file = None
+
+    def load(self):
+
+        if not os.path.exists(self.filename):
+            return False
+
+        with open(self.filename, "r") as f:
+            lines = f.read().splitlines()
+
+        if (len(lines) == 0) or (lines[0] != self.run_id):
+            return False
+
+        self.done = dict()
+
+        for line in lines[1:]:
+            if line == "":
+                continue
+
+            name, _, destination = line.partition("\t")
+            self.done[name] = destination if destination != "" else None
+
+        return True
+
+    def start(self, resume = False):
+
+        if resume and self.load():
+            self.file = open(self.filename, "a")
+        else:
+            self.done = dict()
+            self.file = open(self.filename, "w")
+            self.file.write(self.run_id + "\n")
+            self.file.flush()
+
+    def is_done(self, name):
+        return name in self.done
+
+    def destination(self, name):
+        return self.done.get(name)
+
+    def mark_done(self, name, destination = None):
+        self.done[name] = destination
+
+        line = name
+
+        if destination:
+            line += "\t" + destination
+
+        # flush per file so a crash loses at most the current file
+        self.file.write(line + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+def run_id(*args):
+    h = hashlib.sha1()
+
+    for arg in args:
+        h.update(repr(arg).encode("utf-8"))
+        h.update(b"\0")
+
+    return h.hexdigest()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from . import file
+
+class DedupIndex():
+    # content index of library and incoming files, stored on disk so only
+    # new or changed files are hashed again, entries are keyed by path and
+    # hold [size, mtime, partial checksum, full checksum]
+    def __init__(self, filename = None):
+        self.filename = filename
+        self.entries = dict()
+        self.library = []
+        self.incoming = []
+
+    def load(self):
+
+        if (not self.filename) or (not os.path.exists(self.filename)):
+            return
+
+        try:
+            with open(self.filename, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            # unreadable index only costs hashing again
+            self.entries = dict()
+
+    def save(self):
+
+        if not self.filename:
+            return
+
+        # drop files that no longer exist
+        entries = { path: entry for path, entry in self.entries.items() if os.path.exists(path) }
+
+        tmp = self.filename + ".tmp"
+
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+
+        os.replace(tmp, self.filename)
+
+    def entry(self, path):
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self.entries.get(path)
+
+        # changed since it was indexed
+        if (entry is None) or (entry[0] != st.st_size) or (entry[1] != st.st_mtime_ns):
+            entry = [st.st_size, st.st_mtime_ns, None, None]
+            self.entries[path] = entry
+
+        return entry
+
+    def add_transfer(self, src, dest, moved = False):
+        # dest now holds the content of src, keep its checksums under the
+        # new path so the next run doesn't hash it again
+
+        src = os.path.abspath(src)
+        dest = os.path.abspath(dest)
+
+        entry = self.entries.pop(src, None) if moved else self.entries.get(src)
+
+        if entry is None:
+            return
+
+        try:
+            st = os.stat(dest)
+        except OSError:
+            return
+
+        self.entries[dest] = [st.st_size, st.st_mtime_ns, entry[2], entry[3]]
+
+    def add_library(self, path):
+        self.library.append(os.path.abspath(path))
+
+    def add_incoming(self, path):
+        self.incoming.append(os.path.abspath(path))
+
+    def checksum(self, path, full):
+
+        entry = self.entry(path)
+        i = 3 if full else 2
+
+        if entry[i] is None:
+            entry[i] = file.content_checksum(path) if full else file.partial_checksum(path)
+
+        return entry[i]
+
+    def group(self, paths, key):
+
+        groups = dict()
+
+        for path in paths:
+            try:
+                groups.setdefault(key(path), []).append(path)
+            except OSError:
+                # unreadable files can't be confirmed as duplicates
+                continue
+
+        return [g for g in groups.values() if len(g) > 1]
+
+    def duplicates(self):
+        # returns {incoming path: path with the same content}, preferring a
+        # library file, otherwise the first incoming file
+
+        rv = dict()
+        incoming = set(self.incoming)
+
+        # library first so it is the original of every group
+        paths = list(dict.fromkeys(self.library + self.incoming))
+        paths = [path for path in paths if self.entry(path) is not None]
+
+        # size, then partial checksum, then full checksum
+        for by_size in self.group(paths, lambda path: self.entry(path)[0]):
+
+            # nothing incoming in this group
+            if not any(path in incoming for path in by_size):
+                continue
+
+            for by_partial in self.group(by_size, lambda path: self.checksum(path, False)):
+                for by_full in self.group(by_partial, lambda path: self.checksum(path, True)):
+
+                    original = by_full[0]
+
+                    for path in by_full[1:]:
+                        if path in incoming:
+                            rv[path] = original
+
+        return rv
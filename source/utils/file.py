@@ -24,9 +24,6 @@ def basename(filename):
 
 def move(src, dest, make_dirs = False):
 
-    src = os.path.join(dirname(src), src)
-    dest = os.path.join(dirname(dest), dest)
-
     if make_dirs:
         makedirs(dest)
 
@@ -34,9 +31,6 @@ def move(src, dest, make_dirs = False):
 
 def copy(src, dest, make_dirs = False):
 
-    src = os.path.join(dirname(src), src)
-    dest = os.path.join(dirname(dest), dest)
-
     if make_dirs:
         makedirs(dest)
         
@@ -57,6 +51,43 @@ def checksum(filename):
 
     return rv
 
+def partial_checksum(filename, block_size = 64 * 1024):
+    # hash of the size, first and last block, cheap way to rule out most
+    # same-sized files before hashing everything
+    h = hashlib.sha1()
+
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h.update(str(size).encode("utf-8"))
+        h.update(f.read(block_size))
+
+        if size > 2 * block_size:
+            f.seek(-block_size, os.SEEK_END)
+            h.update(f.read(block_size))
+
+    return h.hexdigest()
+
+def content_checksum(filename, chunk_size = 1024 * 1024):
+    h = hashlib.sha1()
+
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+
+            if not chunk:
+                break
+
+            h.update(chunk)
+
+    return h.hexdigest()
+
+def link(src, dest, make_dirs = False):
+
+    if make_dirs:
+        makedirs(dest)
+
+    os.link(src, dest)
+
 def extension(filename):
     return os.path.splitext(filename)[1].lower()
 
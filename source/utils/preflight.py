@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+
+def normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def find_collisions(pairs):
+    # pairs of (source, destination), returns [(source, reason)] for every
+    # source that would overwrite another file, the first source of a
+    # destination wins
+
+    rv = []
+    exact = dict()
+    folded = dict()
+
+    for src, dest in pairs:
+        key = normalize(dest)
+
+        if key in exact:
+            rv.append((src, "same destination as \"{}\"".format(exact[key])))
+            continue
+
+        # would overwrite each other on case insensitive filesystems
+        if key.lower() in folded:
+            rv.append((src, "destination only differs in case from \"{}\"".format(folded[key.lower()])))
+            continue
+
+        exact[key] = src
+        folded[key.lower()] = src
+
+        if os.path.lexists(dest) and (normalize(src) != key):
+            rv.append((src, "destination already exists \"{}\"".format(dest)))
+
+    return rv
+
+def existing_parent(path):
+
+    path = os.path.abspath(path)
+
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+
+        if parent == path:
+            break
+
+        path = parent
+
+    return path
+
+def device(path):
+    return os.stat(existing_parent(path)).st_dev
+
+def free_space(path):
+    st = os.statvfs(existing_parent(path))
+    return st.f_bavail * st.f_frsize
+
+def space_shortfall(needs):
+    # needs are (destination, bytes), returns [(destination, needed, free)]
+    # for every device without room for everything written to it
+
+    totals = dict()
+
+    for dest, size in needs:
+        dev = device(os.path.dirname(os.path.abspath(dest)))
+
+        if dev not in totals:
+            totals[dev] = [dest, 0]
+
+        totals[dev][1] += size
+
+    rv = []
+
+    for dest, needed in totals.values():
+        free = free_space(os.path.dirname(os.path.abspath(dest)))
+
+        if needed > free:
+            rv.append((dest, needed, free))
+
+    return rv
+
+def make_dirs(destinations):
+    # create every destination directory once, parents before children
+
+    dirs = set(os.path.dirname(os.path.abspath(dest)) for dest in destinations)
+
+    for directory in sorted(dirs):
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import re
+
+MAX_COMPONENT_BYTES = 255
+
+# replacements for characters that aren't allowed in filenames
+ILLEGAL_CHARS = [ (": ", " - "), (":", "-"), ("/", "-"), ("\\", "-"), ("\"", "'"),
+                  ("*", ""), ("?", ""), ("<", ""), (">", ""), ("|", "") ]
+
+RESERVED_NAMES = [ "con", "prn", "aux", "nul" ] + \
+                 [ "com{}".format(i) for i in range(1, 10) ] + \
+                 [ "lpt{}".format(i) for i in range(1, 10) ]
+
+class _Literal():
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, values):
+        return self.text
+
+class _Token():
+    def __init__(self, name, width):
+        self.name = name
+        self.width = width
+
+    def render(self, values):
+        value = values.get(self.name)
+
+        if value is None:
+            return ""
+
+        if (self.width is not None) and isinstance(value, int):
+            return "{:0{width}d}".format(value, width = self.width)
+
+        return sanitize(str(value))
+
+class _Conditional():
+    # rendered only if every token in it has a value
+    def __init__(self, parts):
+        self.parts = parts
+
+    def render(self, values):
+        rendered = [part.render(values) for part in self.parts]
+
+        for part, s in zip(self.parts, rendered):
+            if isinstance(part, _Token) and (s == ""):
+                return ""
+
+        return "".join(rendered)
+
+class Template():
+    # a naming format parsed once, "%X" tokens, "%NX" to zero pad numbers to
+    # N digits, "{...}" for segments dropped when a token in them is empty
+    # and "%%" for a literal "%"
+    def __init__(self, format, tokens, widths = None):
+        self.format = format
+        self.tokens = tokens
+        self.widths = widths if widths else dict()
+        self.parts = self.parse()
+
+    def parse(self):
+
+        parts = []
+        stack = []
+        text = ""
+
+        for m in re.finditer(r"%%|%(\d*)([a-zA-Z])|%|\{|\}|[^%{}]+", self.format):
+            s = m.group(0)
+
+            if s == "%%":
+                text += "%"
+                continue
+
+            if s == "%":
+                raise ValueError("incomplete token at end of \"{}\"".format(self.format))
+
+            if (not s.startswith("%")) and (s not in ["{", "}"]):
+                text += s
+                continue
+
+            if text:
+                parts.append(_Literal(text))
+                text = ""
+
+            if s == "{":
+                stack.append(parts)
+                parts = []
+            elif s == "}":
+                if len(stack) == 0:
+                    raise ValueError("unmatched \"}}\" in \"{}\"".format(self.format))
+
+                conditional = _Conditional(parts)
+                parts = stack.pop()
+                parts.append(conditional)
+            else:
+                name = m.group(2)
+
+                if name not in self.tokens:
+                    raise ValueError("unknown token \"%{}\" in \"{}\"".format(name, self.format))
+
+                width = int(m.group(1)) if m.group(1) else self.widths.get(name)
+                parts.append(_Token(name, width))
+
+        if len(stack) > 0:
+            raise ValueError("unmatched \"{{\" in \"{}\"".format(self.format))
+
+        if text:
+            parts.append(_Literal(text))
+
+        return parts
+
+    def render(self, values, suffix = ""):
+        # suffix (e.g. the extension) is appended to the last path component
+        # and counted in its length
+
+        path = "".join(part.render(values) for part in self.parts)
+
+        components = path.split("/")
+        last = len(components) - 1
+        rv = []
+
+        for i, component in enumerate(components):
+
+            # keep the root of absolute paths
+            if (i == 0) and (component == ""):
+                rv.append("")
+                continue
+
+            reserve = len(suffix.encode("utf-8")) if i == last else 0
+            component = clean_component(component, MAX_COMPONENT_BYTES - reserve)
+
+            if component != "":
+                rv.append(component)
+
+        return "/".join(rv) + suffix
+
+def sanitize(s):
+
+    for old, new in ILLEGAL_CHARS:
+        s = s.replace(old, new)
+
+    # control characters
+    return re.sub(r"[\x00-\x1f\x7f]", "", s)
+
+def clean_component(s, max_bytes = MAX_COMPONENT_BYTES):
+
+    # left by empty tokens
+    s = re.sub(" {2,}", " ", s).strip()
+
+    if s in [".", ".."]:
+        return s
+
+    # trailing dots and spaces are dropped by some filesystems
+    s = s.rstrip(". ")
+
+    if s.split(".")[0].lower() in RESERVED_NAMES:
+        s = "_" + s
+
+    # cut on a character boundary
+    encoded = s.encode("utf-8")
+
+    if len(encoded) > max_bytes:
+        s = encoded[:max_bytes].decode("utf-8", "ignore").rstrip(". ")
+
+    return s